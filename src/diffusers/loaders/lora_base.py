@@ -174,6 +174,14 @@ def enable_lora_for_text_encoder(text_encoder: Optional["PreTrainedModel"] = Non
     set_adapter_layers(text_encoder, enabled=True)
 
 
+def _filter_adapter_keys(keys, adapter_name):
+    """
+    Returns the LoRA keys of `adapter_name` from the `missing_keys` or `unexpected_keys` reported by PEFT.
+    """
+    # The adapter name is the more selective check, so test it first.
+    return [k for k in keys if adapter_name in k and "lora_" in k]
+
+
 def _remove_text_encoder_monkey_patch(text_encoder):
     recurse_remove_peft_layers(text_encoder)
     if getattr(text_encoder, "peft_config", None) is not None:
@@ -215,21 +223,29 @@ class LoraBaseMixin:
         is_sequential_cpu_offload = False
 
         if _pipeline is not None and _pipeline.hf_device_map is None:
-            for _, component in _pipeline.components.items():
-                if isinstance(component, nn.Module) and hasattr(component, "_hf_hook"):
-                    if not is_model_cpu_offload:
-                        is_model_cpu_offload = isinstance(component._hf_hook, CpuOffload)
-                    if not is_sequential_cpu_offload:
-                        is_sequential_cpu_offload = (
-                            isinstance(component._hf_hook, AlignDevicesHook)
-                            or hasattr(component._hf_hook, "hooks")
-                            and isinstance(component._hf_hook.hooks[0], AlignDevicesHook)
-                        )
+            hooked_components = [
+                component
+                for component in _pipeline.components.values()
+                if isinstance(component, nn.Module) and hasattr(component, "_hf_hook")
+            ]
+            if len(hooked_components) > 0:
+                logger.info(
+                    "Accelerate hooks detected. Since you have called `load_lora_weights()`, the previous hooks will be first removed. Then the LoRA parameters will be loaded and the hooks will be applied again."
+                )
 
-                    logger.info(
-                        "Accelerate hooks detected. Since you have called `load_lora_weights()`, the previous hooks will be first removed. Then the LoRA parameters will be loaded and the hooks will be applied again."
+            for component in hooked_components:
+                if not is_model_cpu_offload:
+                    is_model_cpu_offload = isinstance(component._hf_hook, CpuOffload)
+                if not is_sequential_cpu_offload:
+                    is_sequential_cpu_offload = (
+                        isinstance(component._hf_hook, AlignDevicesHook)
+                        or hasattr(component._hf_hook, "hooks")
+                        and isinstance(component._hf_hook.hooks[0], AlignDevicesHook)
                     )
-                    remove_hook_from_module(component, recurse=is_sequential_cpu_offload)
+
+            # Only remove the hooks once the offloading type is known so that all components are handled the same way.
+            for component in hooked_components:
+                remove_hook_from_module(component, recurse=is_sequential_cpu_offload)
 
         return (is_model_cpu_offload, is_sequential_cpu_offload)
 
@@ -279,6 +295,8 @@ class LoraBaseMixin:
                         subfolder=subfolder,
                         user_agent=user_agent,
                     )
+                    # The filtered per-component dicts built from this state dict hold references to the same tensors,
+                    # so the weights are not copied again while loading.
                     state_dict = safetensors.torch.load_file(model_file, device="cpu")
                 except (IOError, safetensors.SafetensorError) as e:
                     if not allow_pickle:
@@ -623,8 +641,7 @@ class LoraBaseMixin:
                 if issubclass(model.__class__, ModelMixin):
                     model.delete_adapters(adapter_names)
                 elif issubclass(model.__class__, PreTrainedModel):
-                    for adapter_name in adapter_names:
-                        delete_adapter_layers(model, adapter_name)
+                    delete_adapter_layers(model, adapter_names)
 
     def get_active_adapters(self) -> List[str]:
         """
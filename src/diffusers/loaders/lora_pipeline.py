@@ -33,7 +33,7 @@ from ..utils import (
     logging,
     scale_lora_layers,
 )
-from .lora_base import LoraBaseMixin
+from .lora_base import LoraBaseMixin, _filter_adapter_keys
 from .lora_conversion_utils import (
     _convert_kohya_flux_lora_to_diffusers,
     _convert_non_diffusers_lora_to_diffusers,
@@ -53,6 +53,9 @@ if is_torch_version(">=", "1.9.0"):
         _LOW_CPU_MEM_USAGE_DEFAULT_LORA = True
 
 
+if USE_PEFT_BACKEND:
+    from peft import LoraConfig, inject_adapter_in_model, set_peft_model_state_dict
+
 if is_transformers_available():
     from ..models.lora import text_encoder_attn_modules, text_encoder_mlp_modules
 
@@ -263,7 +266,14 @@ class StableDiffusionLoraLoaderMixin(LoraBaseMixin):
 
     @classmethod
     def load_lora_into_unet(
-        cls, state_dict, network_alphas, unet, adapter_name=None, _pipeline=None, low_cpu_mem_usage=False
+        cls,
+        state_dict,
+        network_alphas,
+        unet,
+        adapter_name=None,
+        _pipeline=None,
+        low_cpu_mem_usage=False,
+        auto_fuse=False,
     ):
         """
         This will load the LoRA layers specified in `state_dict` into `unet`.
@@ -283,6 +293,10 @@ class StableDiffusionLoraLoaderMixin(LoraBaseMixin):
                 Adapter name to be used for referencing the loaded adapter model. If not specified, it will use
                 `default_{i}` where i is the total number of adapters being loaded.
             Speed up model loading only loading the pretrained LoRA weights and not initializing the random weights.
+            auto_fuse (`bool`, *optional*, defaults to `False`):
+                Whether to fuse the LoRA weights into the base weights of `unet` right after loading them and remove
+                the LoRA layers. This removes the LoRA overhead at inference time, but the LoRA can't be unfused or
+                unloaded afterwards. Only supported when no other adapter is loaded in `unet`.
         """
         if not USE_PEFT_BACKEND:
             raise ValueError("PEFT backend is required for this method.")
@@ -306,6 +320,7 @@ class StableDiffusionLoraLoaderMixin(LoraBaseMixin):
                 adapter_name=adapter_name,
                 _pipeline=_pipeline,
                 low_cpu_mem_usage=low_cpu_mem_usage,
+                auto_fuse=auto_fuse,
             )
 
     @classmethod
@@ -360,8 +375,6 @@ class StableDiffusionLoraLoaderMixin(LoraBaseMixin):
                 )
             peft_kwargs["low_cpu_mem_usage"] = low_cpu_mem_usage
 
-        from peft import LoraConfig
-
         # If the serialization format is new (introduced in https://github.com/huggingface/diffusers/pull/2918),
         # then the `state_dict` keys should have `self.unet_name` and/or `self.text_encoder_name` as
         # their prefixes.
@@ -371,9 +384,8 @@ class StableDiffusionLoraLoaderMixin(LoraBaseMixin):
         # Safe prefix to check with.
         if any(cls.text_encoder_name in key for key in keys):
             # Load the layers corresponding to text encoder and make necessary adjustments.
-            text_encoder_keys = [k for k in keys if k.startswith(prefix) and k.split(".")[0] == prefix]
             text_encoder_lora_state_dict = {
-                k.replace(f"{prefix}.", ""): v for k, v in state_dict.items() if k in text_encoder_keys
+                k.replace(f"{prefix}.", ""): v for k, v in state_dict.items() if k.split(".")[0] == prefix
             }
 
             if len(text_encoder_lora_state_dict) > 0:
@@ -399,11 +411,8 @@ class StableDiffusionLoraLoaderMixin(LoraBaseMixin):
                         rank[rank_key] = text_encoder_lora_state_dict[rank_key].shape[1]
 
                 if network_alphas is not None:
-                    alpha_keys = [
-                        k for k in network_alphas.keys() if k.startswith(prefix) and k.split(".")[0] == prefix
-                    ]
                     network_alphas = {
-                        k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k in alpha_keys
+                        k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k.split(".")[0] == prefix
                     }
 
                 lora_config_kwargs = get_peft_kwargs(rank, network_alphas, text_encoder_lora_state_dict, is_unet=False)
@@ -786,7 +795,14 @@ class StableDiffusionXLLoraLoaderMixin(LoraBaseMixin):
     @classmethod
     # Copied from diffusers.loaders.lora_pipeline.StableDiffusionLoraLoaderMixin.load_lora_into_unet
     def load_lora_into_unet(
-        cls, state_dict, network_alphas, unet, adapter_name=None, _pipeline=None, low_cpu_mem_usage=False
+        cls,
+        state_dict,
+        network_alphas,
+        unet,
+        adapter_name=None,
+        _pipeline=None,
+        low_cpu_mem_usage=False,
+        auto_fuse=False,
     ):
         """
         This will load the LoRA layers specified in `state_dict` into `unet`.
@@ -806,6 +822,10 @@ class StableDiffusionXLLoraLoaderMixin(LoraBaseMixin):
                 Adapter name to be used for referencing the loaded adapter model. If not specified, it will use
                 `default_{i}` where i is the total number of adapters being loaded.
             Speed up model loading only loading the pretrained LoRA weights and not initializing the random weights.
+            auto_fuse (`bool`, *optional*, defaults to `False`):
+                Whether to fuse the LoRA weights into the base weights of `unet` right after loading them and remove
+                the LoRA layers. This removes the LoRA overhead at inference time, but the LoRA can't be unfused or
+                unloaded afterwards. Only supported when no other adapter is loaded in `unet`.
         """
         if not USE_PEFT_BACKEND:
             raise ValueError("PEFT backend is required for this method.")
@@ -829,6 +849,7 @@ class StableDiffusionXLLoraLoaderMixin(LoraBaseMixin):
                 adapter_name=adapter_name,
                 _pipeline=_pipeline,
                 low_cpu_mem_usage=low_cpu_mem_usage,
+                auto_fuse=auto_fuse,
             )
 
     @classmethod
@@ -884,8 +905,6 @@ class StableDiffusionXLLoraLoaderMixin(LoraBaseMixin):
                 )
             peft_kwargs["low_cpu_mem_usage"] = low_cpu_mem_usage
 
-        from peft import LoraConfig
-
         # If the serialization format is new (introduced in https://github.com/huggingface/diffusers/pull/2918),
         # then the `state_dict` keys should have `self.unet_name` and/or `self.text_encoder_name` as
         # their prefixes.
@@ -895,9 +914,8 @@ class StableDiffusionXLLoraLoaderMixin(LoraBaseMixin):
         # Safe prefix to check with.
         if any(cls.text_encoder_name in key for key in keys):
             # Load the layers corresponding to text encoder and make necessary adjustments.
-            text_encoder_keys = [k for k in keys if k.startswith(prefix) and k.split(".")[0] == prefix]
             text_encoder_lora_state_dict = {
-                k.replace(f"{prefix}.", ""): v for k, v in state_dict.items() if k in text_encoder_keys
+                k.replace(f"{prefix}.", ""): v for k, v in state_dict.items() if k.split(".")[0] == prefix
             }
 
             if len(text_encoder_lora_state_dict) > 0:
@@ -923,11 +941,8 @@ class StableDiffusionXLLoraLoaderMixin(LoraBaseMixin):
                         rank[rank_key] = text_encoder_lora_state_dict[rank_key].shape[1]
 
                 if network_alphas is not None:
-                    alpha_keys = [
-                        k for k in network_alphas.keys() if k.startswith(prefix) and k.split(".")[0] == prefix
-                    ]
                     network_alphas = {
-                        k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k in alpha_keys
+                        k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k.split(".")[0] == prefix
                     }
 
                 lora_config_kwargs = get_peft_kwargs(rank, network_alphas, text_encoder_lora_state_dict, is_unet=False)
@@ -1286,7 +1301,7 @@ class SD3LoraLoaderMixin(LoraBaseMixin):
 
     @classmethod
     def load_lora_into_transformer(
-        cls, state_dict, transformer, adapter_name=None, _pipeline=None, low_cpu_mem_usage=False
+        cls, state_dict, transformer, adapter_name=None, _pipeline=None, low_cpu_mem_usage=False, auto_fuse=False
     ):
         """
         This will load the LoRA layers specified in `state_dict` into `transformer`.
@@ -1302,19 +1317,27 @@ class SD3LoraLoaderMixin(LoraBaseMixin):
                 Adapter name to be used for referencing the loaded adapter model. If not specified, it will use
                 `default_{i}` where i is the total number of adapters being loaded.
             Speed up model loading by only loading the pretrained LoRA weights and not initializing the random weights.:
+            auto_fuse (`bool`, *optional*, defaults to `False`):
+                Whether to fuse the LoRA weights into the base weights of `transformer` right after loading them and
+                remove the LoRA layers. This removes the LoRA overhead at inference time, but the LoRA can't be
+                unfused or unloaded afterwards. Only supported when no other adapter is loaded in `transformer`.
         """
+        if not USE_PEFT_BACKEND:
+            raise ValueError("PEFT backend is required for this method.")
+
+        if auto_fuse and getattr(transformer, "peft_config", None):
+            raise ValueError(
+                "`auto_fuse=True` is only supported when no other adapter is loaded in the transformer. Please unload"
+                " the loaded adapters first or use `fuse_lora()` instead."
+            )
         if low_cpu_mem_usage and is_peft_version("<", "0.13.0"):
             raise ValueError(
                 "`low_cpu_mem_usage=True` is not compatible with this `peft` version. Please update it with `pip install -U peft`."
             )
 
-        from peft import LoraConfig, inject_adapter_in_model, set_peft_model_state_dict
-
-        keys = list(state_dict.keys())
-
-        transformer_keys = [k for k in keys if k.startswith(cls.transformer_name)]
+        transformer_prefix = f"{cls.transformer_name}."
         state_dict = {
-            k.replace(f"{cls.transformer_name}.", ""): v for k, v in state_dict.items() if k in transformer_keys
+            k.replace(transformer_prefix, ""): v for k, v in state_dict.items() if k.startswith(cls.transformer_name)
         }
 
         if len(state_dict.keys()) > 0:
@@ -1328,10 +1351,7 @@ class SD3LoraLoaderMixin(LoraBaseMixin):
                     f"Adapter name {adapter_name} already in use in the transformer - please select a new adapter name."
                 )
 
-            rank = {}
-            for key, val in state_dict.items():
-                if "lora_B" in key:
-                    rank[key] = val.shape[1]
+            rank = {key: val.shape[1] for key, val in state_dict.items() if "lora_B" in key}
 
             lora_config_kwargs = get_peft_kwargs(rank, network_alpha_dict=None, peft_state_dict=state_dict)
             if "use_dora" in lora_config_kwargs:
@@ -1356,14 +1376,15 @@ class SD3LoraLoaderMixin(LoraBaseMixin):
                 peft_kwargs["low_cpu_mem_usage"] = low_cpu_mem_usage
 
             inject_adapter_in_model(lora_config, transformer, adapter_name=adapter_name, **peft_kwargs)
+            transformer._invalidate_peft_tuner_layers()
             incompatible_keys = set_peft_model_state_dict(transformer, state_dict, adapter_name, **peft_kwargs)
 
             warn_msg = ""
             if incompatible_keys is not None:
                 # Check only for unexpected keys.
-                unexpected_keys = getattr(incompatible_keys, "unexpected_keys", None)
+                unexpected_keys = incompatible_keys.unexpected_keys
                 if unexpected_keys:
-                    lora_unexpected_keys = [k for k in unexpected_keys if "lora_" in k and adapter_name in k]
+                    lora_unexpected_keys = _filter_adapter_keys(unexpected_keys, adapter_name)
                     if lora_unexpected_keys:
                         warn_msg = (
                             f"Loading adapter weights from state_dict led to unexpected keys found in the model:"
@@ -1371,9 +1392,9 @@ class SD3LoraLoaderMixin(LoraBaseMixin):
                         )
 
                 # Filter missing keys specific to the current adapter.
-                missing_keys = getattr(incompatible_keys, "missing_keys", None)
+                missing_keys = incompatible_keys.missing_keys
                 if missing_keys:
-                    lora_missing_keys = [k for k in missing_keys if "lora_" in k and adapter_name in k]
+                    lora_missing_keys = _filter_adapter_keys(missing_keys, adapter_name)
                     if lora_missing_keys:
                         warn_msg += (
                             f"Loading adapter weights from state_dict led to missing keys in the model:"
@@ -1383,6 +1404,10 @@ class SD3LoraLoaderMixin(LoraBaseMixin):
             if warn_msg:
                 logger.warning(warn_msg)
 
+            if auto_fuse:
+                transformer.fuse_lora()
+                transformer.unload_lora()
+
             # Offload back.
             if is_model_cpu_offload:
                 _pipeline.enable_model_cpu_offload()
@@ -1443,8 +1468,6 @@ class SD3LoraLoaderMixin(LoraBaseMixin):
                 )
             peft_kwargs["low_cpu_mem_usage"] = low_cpu_mem_usage
 
-        from peft import LoraConfig
-
         # If the serialization format is new (introduced in https://github.com/huggingface/diffusers/pull/2918),
         # then the `state_dict` keys should have `self.unet_name` and/or `self.text_encoder_name` as
         # their prefixes.
@@ -1454,9 +1477,8 @@ class SD3LoraLoaderMixin(LoraBaseMixin):
         # Safe prefix to check with.
         if any(cls.text_encoder_name in key for key in keys):
             # Load the layers corresponding to text encoder and make necessary adjustments.
-            text_encoder_keys = [k for k in keys if k.startswith(prefix) and k.split(".")[0] == prefix]
             text_encoder_lora_state_dict = {
-                k.replace(f"{prefix}.", ""): v for k, v in state_dict.items() if k in text_encoder_keys
+                k.replace(f"{prefix}.", ""): v for k, v in state_dict.items() if k.split(".")[0] == prefix
             }
 
             if len(text_encoder_lora_state_dict) > 0:
@@ -1482,11 +1504,8 @@ class SD3LoraLoaderMixin(LoraBaseMixin):
                         rank[rank_key] = text_encoder_lora_state_dict[rank_key].shape[1]
 
                 if network_alphas is not None:
-                    alpha_keys = [
-                        k for k in network_alphas.keys() if k.startswith(prefix) and k.split(".")[0] == prefix
-                    ]
                     network_alphas = {
-                        k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k in alpha_keys
+                        k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k.split(".")[0] == prefix
                     }
 
                 lora_config_kwargs = get_peft_kwargs(rank, network_alphas, text_encoder_lora_state_dict, is_unet=False)
@@ -1867,7 +1886,14 @@ class FluxLoraLoaderMixin(LoraBaseMixin):
 
     @classmethod
     def load_lora_into_transformer(
-        cls, state_dict, network_alphas, transformer, adapter_name=None, _pipeline=None, low_cpu_mem_usage=False
+        cls,
+        state_dict,
+        network_alphas,
+        transformer,
+        adapter_name=None,
+        _pipeline=None,
+        low_cpu_mem_usage=False,
+        auto_fuse=False,
     ):
         """
         This will load the LoRA layers specified in `state_dict` into `transformer`.
@@ -1887,19 +1913,27 @@ class FluxLoraLoaderMixin(LoraBaseMixin):
                 Adapter name to be used for referencing the loaded adapter model. If not specified, it will use
                 `default_{i}` where i is the total number of adapters being loaded.
             Speed up model loading by only loading the pretrained LoRA weights and not initializing the random weights.:
+            auto_fuse (`bool`, *optional*, defaults to `False`):
+                Whether to fuse the LoRA weights into the base weights of `transformer` right after loading them and
+                remove the LoRA layers. This removes the LoRA overhead at inference time, but the LoRA can't be
+                unfused or unloaded afterwards. Only supported when no other adapter is loaded in `transformer`.
         """
+        if not USE_PEFT_BACKEND:
+            raise ValueError("PEFT backend is required for this method.")
+
+        if auto_fuse and getattr(transformer, "peft_config", None):
+            raise ValueError(
+                "`auto_fuse=True` is only supported when no other adapter is loaded in the transformer. Please unload"
+                " the loaded adapters first or use `fuse_lora()` instead."
+            )
         if low_cpu_mem_usage and not is_peft_version(">=", "0.13.1"):
             raise ValueError(
                 "`low_cpu_mem_usage=True` is not compatible with this `peft` version. Please update it with `pip install -U peft`."
             )
 
-        from peft import LoraConfig, inject_adapter_in_model, set_peft_model_state_dict
-
-        keys = list(state_dict.keys())
-
-        transformer_keys = [k for k in keys if k.startswith(cls.transformer_name)]
+        transformer_prefix = f"{cls.transformer_name}."
         state_dict = {
-            k.replace(f"{cls.transformer_name}.", ""): v for k, v in state_dict.items() if k in transformer_keys
+            k.replace(transformer_prefix, ""): v for k, v in state_dict.items() if k.startswith(cls.transformer_name)
         }
 
         if len(state_dict.keys()) > 0:
@@ -1913,15 +1947,13 @@ class FluxLoraLoaderMixin(LoraBaseMixin):
                     f"Adapter name {adapter_name} already in use in the transformer - please select a new adapter name."
                 )
 
-            rank = {}
-            for key, val in state_dict.items():
-                if "lora_B" in key:
-                    rank[key] = val.shape[1]
+            rank = {key: val.shape[1] for key, val in state_dict.items() if "lora_B" in key}
 
             if network_alphas is not None and len(network_alphas) >= 1:
                 prefix = cls.transformer_name
-                alpha_keys = [k for k in network_alphas.keys() if k.startswith(prefix) and k.split(".")[0] == prefix]
-                network_alphas = {k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k in alpha_keys}
+                network_alphas = {
+                    k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k.split(".")[0] == prefix
+                }
 
             lora_config_kwargs = get_peft_kwargs(rank, network_alpha_dict=network_alphas, peft_state_dict=state_dict)
             if "use_dora" in lora_config_kwargs:
@@ -1946,14 +1978,15 @@ class FluxLoraLoaderMixin(LoraBaseMixin):
                 peft_kwargs["low_cpu_mem_usage"] = low_cpu_mem_usage
 
             inject_adapter_in_model(lora_config, transformer, adapter_name=adapter_name, **peft_kwargs)
+            transformer._invalidate_peft_tuner_layers()
             incompatible_keys = set_peft_model_state_dict(transformer, state_dict, adapter_name, **peft_kwargs)
 
             warn_msg = ""
             if incompatible_keys is not None:
                 # Check only for unexpected keys.
-                unexpected_keys = getattr(incompatible_keys, "unexpected_keys", None)
+                unexpected_keys = incompatible_keys.unexpected_keys
                 if unexpected_keys:
-                    lora_unexpected_keys = [k for k in unexpected_keys if "lora_" in k and adapter_name in k]
+                    lora_unexpected_keys = _filter_adapter_keys(unexpected_keys, adapter_name)
                     if lora_unexpected_keys:
                         warn_msg = (
                             f"Loading adapter weights from state_dict led to unexpected keys found in the model:"
@@ -1961,9 +1994,9 @@ class FluxLoraLoaderMixin(LoraBaseMixin):
                         )
 
                 # Filter missing keys specific to the current adapter.
-                missing_keys = getattr(incompatible_keys, "missing_keys", None)
+                missing_keys = incompatible_keys.missing_keys
                 if missing_keys:
-                    lora_missing_keys = [k for k in missing_keys if "lora_" in k and adapter_name in k]
+                    lora_missing_keys = _filter_adapter_keys(missing_keys, adapter_name)
                     if lora_missing_keys:
                         warn_msg += (
                             f"Loading adapter weights from state_dict led to missing keys in the model:"
@@ -1973,6 +2006,10 @@ class FluxLoraLoaderMixin(LoraBaseMixin):
             if warn_msg:
                 logger.warning(warn_msg)
 
+            if auto_fuse:
+                transformer.fuse_lora()
+                transformer.unload_lora()
+
             # Offload back.
             if is_model_cpu_offload:
                 _pipeline.enable_model_cpu_offload()
@@ -2033,8 +2070,6 @@ class FluxLoraLoaderMixin(LoraBaseMixin):
                 )
             peft_kwargs["low_cpu_mem_usage"] = low_cpu_mem_usage
 
-        from peft import LoraConfig
-
         # If the serialization format is new (introduced in https://github.com/huggingface/diffusers/pull/2918),
         # then the `state_dict` keys should have `self.unet_name` and/or `self.text_encoder_name` as
         # their prefixes.
@@ -2044,9 +2079,8 @@ class FluxLoraLoaderMixin(LoraBaseMixin):
         # Safe prefix to check with.
         if any(cls.text_encoder_name in key for key in keys):
             # Load the layers corresponding to text encoder and make necessary adjustments.
-            text_encoder_keys = [k for k in keys if k.startswith(prefix) and k.split(".")[0] == prefix]
             text_encoder_lora_state_dict = {
-                k.replace(f"{prefix}.", ""): v for k, v in state_dict.items() if k in text_encoder_keys
+                k.replace(f"{prefix}.", ""): v for k, v in state_dict.items() if k.split(".")[0] == prefix
             }
 
             if len(text_encoder_lora_state_dict) > 0:
@@ -2072,11 +2106,8 @@ class FluxLoraLoaderMixin(LoraBaseMixin):
                         rank[rank_key] = text_encoder_lora_state_dict[rank_key].shape[1]
 
                 if network_alphas is not None:
-                    alpha_keys = [
-                        k for k in network_alphas.keys() if k.startswith(prefix) and k.split(".")[0] == prefix
-                    ]
                     network_alphas = {
-                        k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k in alpha_keys
+                        k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k.split(".")[0] == prefix
                     }
 
                 lora_config_kwargs = get_peft_kwargs(rank, network_alphas, text_encoder_lora_state_dict, is_unet=False)
@@ -2242,7 +2273,9 @@ class AmusedLoraLoaderMixin(StableDiffusionLoraLoaderMixin):
     text_encoder_name = TEXT_ENCODER_NAME
 
     @classmethod
-    def load_lora_into_transformer(cls, state_dict, network_alphas, transformer, adapter_name=None, _pipeline=None):
+    def load_lora_into_transformer(
+        cls, state_dict, network_alphas, transformer, adapter_name=None, _pipeline=None, auto_fuse=False
+    ):
         """
         This will load the LoRA layers specified in `state_dict` into `transformer`.
 
@@ -2260,23 +2293,30 @@ class AmusedLoraLoaderMixin(StableDiffusionLoraLoaderMixin):
             adapter_name (`str`, *optional*):
                 Adapter name to be used for referencing the loaded adapter model. If not specified, it will use
                 `default_{i}` where i is the total number of adapters being loaded.
+            auto_fuse (`bool`, *optional*, defaults to `False`):
+                Whether to fuse the LoRA weights into the base weights of `transformer` right after loading them and
+                remove the LoRA layers. This removes the LoRA overhead at inference time, but the LoRA can't be
+                unfused or unloaded afterwards. Only supported when no other adapter is loaded in `transformer`.
         """
         if not USE_PEFT_BACKEND:
             raise ValueError("PEFT backend is required for this method.")
 
-        from peft import LoraConfig, inject_adapter_in_model, set_peft_model_state_dict
-
-        keys = list(state_dict.keys())
+        if auto_fuse and getattr(transformer, "peft_config", None):
+            raise ValueError(
+                "`auto_fuse=True` is only supported when no other adapter is loaded in the transformer. Please unload"
+                " the loaded adapters first or use `fuse_lora()` instead."
+            )
 
-        transformer_keys = [k for k in keys if k.startswith(cls.transformer_name)]
+        transformer_prefix = f"{cls.transformer_name}."
         state_dict = {
-            k.replace(f"{cls.transformer_name}.", ""): v for k, v in state_dict.items() if k in transformer_keys
+            k.replace(transformer_prefix, ""): v for k, v in state_dict.items() if k.startswith(cls.transformer_name)
         }
 
         if network_alphas is not None:
-            alpha_keys = [k for k in network_alphas.keys() if k.startswith(cls.transformer_name)]
             network_alphas = {
-                k.replace(f"{cls.transformer_name}.", ""): v for k, v in network_alphas.items() if k in alpha_keys
+                k.replace(transformer_prefix, ""): v
+                for k, v in network_alphas.items()
+                if k.startswith(cls.transformer_name)
             }
 
         if len(state_dict.keys()) > 0:
@@ -2285,10 +2325,7 @@ class AmusedLoraLoaderMixin(StableDiffusionLoraLoaderMixin):
                     f"Adapter name {adapter_name} already in use in the transformer - please select a new adapter name."
                 )
 
-            rank = {}
-            for key, val in state_dict.items():
-                if "lora_B" in key:
-                    rank[key] = val.shape[1]
+            rank = {key: val.shape[1] for key, val in state_dict.items() if "lora_B" in key}
 
             lora_config_kwargs = get_peft_kwargs(rank, network_alphas, state_dict)
             if "use_dora" in lora_config_kwargs:
@@ -2309,14 +2346,15 @@ class AmusedLoraLoaderMixin(StableDiffusionLoraLoaderMixin):
             is_model_cpu_offload, is_sequential_cpu_offload = cls._optionally_disable_offloading(_pipeline)
 
             inject_adapter_in_model(lora_config, transformer, adapter_name=adapter_name)
+            transformer._invalidate_peft_tuner_layers()
             incompatible_keys = set_peft_model_state_dict(transformer, state_dict, adapter_name)
 
             warn_msg = ""
             if incompatible_keys is not None:
                 # Check only for unexpected keys.
-                unexpected_keys = getattr(incompatible_keys, "unexpected_keys", None)
+                unexpected_keys = incompatible_keys.unexpected_keys
                 if unexpected_keys:
-                    lora_unexpected_keys = [k for k in unexpected_keys if "lora_" in k and adapter_name in k]
+                    lora_unexpected_keys = _filter_adapter_keys(unexpected_keys, adapter_name)
                     if lora_unexpected_keys:
                         warn_msg = (
                             f"Loading adapter weights from state_dict led to unexpected keys found in the model:"
@@ -2324,9 +2362,9 @@ class AmusedLoraLoaderMixin(StableDiffusionLoraLoaderMixin):
                         )
 
                 # Filter missing keys specific to the current adapter.
-                missing_keys = getattr(incompatible_keys, "missing_keys", None)
+                missing_keys = incompatible_keys.missing_keys
                 if missing_keys:
-                    lora_missing_keys = [k for k in missing_keys if "lora_" in k and adapter_name in k]
+                    lora_missing_keys = _filter_adapter_keys(missing_keys, adapter_name)
                     if lora_missing_keys:
                         warn_msg += (
                             f"Loading adapter weights from state_dict led to missing keys in the model:"
@@ -2336,6 +2374,10 @@ class AmusedLoraLoaderMixin(StableDiffusionLoraLoaderMixin):
             if warn_msg:
                 logger.warning(warn_msg)
 
+            if auto_fuse:
+                transformer.fuse_lora()
+                transformer.unload_lora()
+
             # Offload back.
             if is_model_cpu_offload:
                 _pipeline.enable_model_cpu_offload()
@@ -2396,8 +2438,6 @@ class AmusedLoraLoaderMixin(StableDiffusionLoraLoaderMixin):
                 )
             peft_kwargs["low_cpu_mem_usage"] = low_cpu_mem_usage
 
-        from peft import LoraConfig
-
         # If the serialization format is new (introduced in https://github.com/huggingface/diffusers/pull/2918),
         # then the `state_dict` keys should have `self.unet_name` and/or `self.text_encoder_name` as
         # their prefixes.
@@ -2407,9 +2447,8 @@ class AmusedLoraLoaderMixin(StableDiffusionLoraLoaderMixin):
         # Safe prefix to check with.
         if any(cls.text_encoder_name in key for key in keys):
             # Load the layers corresponding to text encoder and make necessary adjustments.
-            text_encoder_keys = [k for k in keys if k.startswith(prefix) and k.split(".")[0] == prefix]
             text_encoder_lora_state_dict = {
-                k.replace(f"{prefix}.", ""): v for k, v in state_dict.items() if k in text_encoder_keys
+                k.replace(f"{prefix}.", ""): v for k, v in state_dict.items() if k.split(".")[0] == prefix
             }
 
             if len(text_encoder_lora_state_dict) > 0:
@@ -2435,11 +2474,8 @@ class AmusedLoraLoaderMixin(StableDiffusionLoraLoaderMixin):
                         rank[rank_key] = text_encoder_lora_state_dict[rank_key].shape[1]
 
                 if network_alphas is not None:
-                    alpha_keys = [
-                        k for k in network_alphas.keys() if k.startswith(prefix) and k.split(".")[0] == prefix
-                    ]
                     network_alphas = {
-                        k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k in alpha_keys
+                        k.replace(f"{prefix}.", ""): v for k, v in network_alphas.items() if k.split(".")[0] == prefix
                     }
 
                 lora_config_kwargs = get_peft_kwargs(rank, network_alphas, text_encoder_lora_state_dict, is_unet=False)
@@ -2693,7 +2729,7 @@ class CogVideoXLoraLoaderMixin(LoraBaseMixin):
     @classmethod
     # Copied from diffusers.loaders.lora_pipeline.SD3LoraLoaderMixin.load_lora_into_transformer
     def load_lora_into_transformer(
-        cls, state_dict, transformer, adapter_name=None, _pipeline=None, low_cpu_mem_usage=False
+        cls, state_dict, transformer, adapter_name=None, _pipeline=None, low_cpu_mem_usage=False, auto_fuse=False
     ):
         """
         This will load the LoRA layers specified in `state_dict` into `transformer`.
@@ -2709,19 +2745,27 @@ class CogVideoXLoraLoaderMixin(LoraBaseMixin):
                 Adapter name to be used for referencing the loaded adapter model. If not specified, it will use
                 `default_{i}` where i is the total number of adapters being loaded.
             Speed up model loading by only loading the pretrained LoRA weights and not initializing the random weights.:
+            auto_fuse (`bool`, *optional*, defaults to `False`):
+                Whether to fuse the LoRA weights into the base weights of `transformer` right after loading them and
+                remove the LoRA layers. This removes the LoRA overhead at inference time, but the LoRA can't be
+                unfused or unloaded afterwards. Only supported when no other adapter is loaded in `transformer`.
         """
+        if not USE_PEFT_BACKEND:
+            raise ValueError("PEFT backend is required for this method.")
+
+        if auto_fuse and getattr(transformer, "peft_config", None):
+            raise ValueError(
+                "`auto_fuse=True` is only supported when no other adapter is loaded in the transformer. Please unload"
+                " the loaded adapters first or use `fuse_lora()` instead."
+            )
         if low_cpu_mem_usage and is_peft_version("<", "0.13.0"):
             raise ValueError(
                 "`low_cpu_mem_usage=True` is not compatible with this `peft` version. Please update it with `pip install -U peft`."
             )
 
-        from peft import LoraConfig, inject_adapter_in_model, set_peft_model_state_dict
-
-        keys = list(state_dict.keys())
-
-        transformer_keys = [k for k in keys if k.startswith(cls.transformer_name)]
+        transformer_prefix = f"{cls.transformer_name}."
         state_dict = {
-            k.replace(f"{cls.transformer_name}.", ""): v for k, v in state_dict.items() if k in transformer_keys
+            k.replace(transformer_prefix, ""): v for k, v in state_dict.items() if k.startswith(cls.transformer_name)
         }
 
         if len(state_dict.keys()) > 0:
@@ -2735,10 +2779,7 @@ class CogVideoXLoraLoaderMixin(LoraBaseMixin):
                     f"Adapter name {adapter_name} already in use in the transformer - please select a new adapter name."
                 )
 
-            rank = {}
-            for key, val in state_dict.items():
-                if "lora_B" in key:
-                    rank[key] = val.shape[1]
+            rank = {key: val.shape[1] for key, val in state_dict.items() if "lora_B" in key}
 
             lora_config_kwargs = get_peft_kwargs(rank, network_alpha_dict=None, peft_state_dict=state_dict)
             if "use_dora" in lora_config_kwargs:
@@ -2763,14 +2804,15 @@ class CogVideoXLoraLoaderMixin(LoraBaseMixin):
                 peft_kwargs["low_cpu_mem_usage"] = low_cpu_mem_usage
 
             inject_adapter_in_model(lora_config, transformer, adapter_name=adapter_name, **peft_kwargs)
+            transformer._invalidate_peft_tuner_layers()
             incompatible_keys = set_peft_model_state_dict(transformer, state_dict, adapter_name, **peft_kwargs)
 
             warn_msg = ""
             if incompatible_keys is not None:
                 # Check only for unexpected keys.
-                unexpected_keys = getattr(incompatible_keys, "unexpected_keys", None)
+                unexpected_keys = incompatible_keys.unexpected_keys
                 if unexpected_keys:
-                    lora_unexpected_keys = [k for k in unexpected_keys if "lora_" in k and adapter_name in k]
+                    lora_unexpected_keys = _filter_adapter_keys(unexpected_keys, adapter_name)
                     if lora_unexpected_keys:
                         warn_msg = (
                             f"Loading adapter weights from state_dict led to unexpected keys found in the model:"
@@ -2778,9 +2820,9 @@ class CogVideoXLoraLoaderMixin(LoraBaseMixin):
                         )
 
                 # Filter missing keys specific to the current adapter.
-                missing_keys = getattr(incompatible_keys, "missing_keys", None)
+                missing_keys = incompatible_keys.missing_keys
                 if missing_keys:
-                    lora_missing_keys = [k for k in missing_keys if "lora_" in k and adapter_name in k]
+                    lora_missing_keys = _filter_adapter_keys(missing_keys, adapter_name)
                     if lora_missing_keys:
                         warn_msg += (
                             f"Loading adapter weights from state_dict led to missing keys in the model:"
@@ -2790,6 +2832,10 @@ class CogVideoXLoraLoaderMixin(LoraBaseMixin):
             if warn_msg:
                 logger.warning(warn_msg)
 
+            if auto_fuse:
+                transformer.fuse_lora()
+                transformer.unload_lora()
+
             # Offload back.
             if is_model_cpu_offload:
                 _pipeline.enable_model_cpu_offload()
@@ -13,7 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import inspect
-from functools import partial
+from functools import lru_cache
 from typing import Dict, List, Optional, Union
 
 from ..utils import (
@@ -22,6 +22,7 @@ from ..utils import (
     check_peft_version,
     delete_adapter_layers,
     is_peft_available,
+    recurse_remove_peft_layers,
     set_adapter_layers,
     set_weights_and_activate_adapters,
 )
@@ -37,6 +38,23 @@ _SET_ADAPTER_SCALE_FN_MAPPING = {
 }
 
 
+@lru_cache(maxsize=None)
+def _get_scale_expansion_fn(model_cls):
+    # Walk the MRO so that subclasses of the supported models resolve to the function of their parent class.
+    for cls in model_cls.__mro__:
+        if cls.__name__ in _SET_ADAPTER_SCALE_FN_MAPPING:
+            return _SET_ADAPTER_SCALE_FN_MAPPING[cls.__name__]
+    # Models without block-wise scales use the weights as they are, like the transformers in the mapping.
+    return lambda model_cls, weights: weights
+
+
+@lru_cache(maxsize=None)
+def _merge_supports_adapter_names(tuner_layer_cls) -> bool:
+    # For BC with previous PEFT versions, we need to check the signature of the `merge` method to see if it supports
+    # the `adapter_names` argument. The result only depends on the layer class, so we cache it.
+    return "adapter_names" in inspect.signature(tuner_layer_cls.merge).parameters
+
+
 class PeftAdapterMixin:
     """
     A class containing all functions for loading and using adapters weights that are supported in PEFT library. For
@@ -52,6 +70,9 @@ class PeftAdapterMixin:
     """
 
     _hf_peft_config_loaded = False
+    # Cached PEFT tuner layers of the model, see `_get_peft_tuner_layers()`.
+    _peft_tuner_layers = None
+    _peft_tuner_layers_key = None
 
     def set_adapters(
         self,
@@ -87,24 +108,29 @@ class PeftAdapterMixin:
         if not USE_PEFT_BACKEND:
             raise ValueError("PEFT backend is required for `set_adapters()`.")
 
-        adapter_names = [adapter_names] if isinstance(adapter_names, str) else adapter_names
+        if isinstance(adapter_names, str) and not isinstance(weights, list):
+            # Fast path for the common case of a single adapter with a single weight
+            adapter_names = [adapter_names]
+            weights = [weights if weights is not None else 1.0]
+        else:
+            adapter_names = [adapter_names] if isinstance(adapter_names, str) else adapter_names
 
-        # Expand weights into a list, one entry per adapter
-        # examples for e.g. 2 adapters:  [{...}, 7] -> [7,7] ; None -> [None, None]
-        if not isinstance(weights, list):
-            weights = [weights] * len(adapter_names)
+            # Expand weights into a list, one entry per adapter
+            # examples for e.g. 2 adapters:  [{...}, 7] -> [7,7] ; None -> [None, None]
+            if not isinstance(weights, list):
+                weights = [weights] * len(adapter_names)
 
-        if len(adapter_names) != len(weights):
-            raise ValueError(
-                f"Length of adapter names {len(adapter_names)} is not equal to the length of their weights {len(weights)}."
-            )
+            if len(adapter_names) != len(weights):
+                raise ValueError(
+                    f"Length of adapter names {len(adapter_names)} is not equal to the length of their weights {len(weights)}."
+                )
 
-        # Set None values to default of 1.0
-        # e.g. [{...}, 7] -> [{...}, 7] ; [None, None] -> [1.0, 1.0]
-        weights = [w if w is not None else 1.0 for w in weights]
+            # Set None values to default of 1.0
+            # e.g. [{...}, 7] -> [{...}, 7] ; [None, None] -> [1.0, 1.0]
+            weights = [w if w is not None else 1.0 for w in weights]
 
         # e.g. [{...}, 7] -> [{expanded dict...}, 7]
-        scale_expansion_fn = _SET_ADAPTER_SCALE_FN_MAPPING[self.__class__.__name__]
+        scale_expansion_fn = _get_scale_expansion_fn(self.__class__)
         weights = scale_expansion_fn(self, weights)
 
         set_weights_and_activate_adapters(self, adapter_names, weights)
@@ -145,8 +171,30 @@ class PeftAdapterMixin:
         # handled by the `load_lora_layers` or `StableDiffusionLoraLoaderMixin`. Therefore we set it to `None` here.
         adapter_config.base_model_name_or_path = None
         inject_adapter_in_model(adapter_config, self, adapter_name)
+        self._invalidate_peft_tuner_layers()
         self.set_adapter(adapter_name)
 
+    def _get_peft_tuner_layers(self) -> List:
+        """
+        Returns the PEFT tuner layers (`BaseTunerLayer` instances) of the model.
+
+        Walking `named_modules()` is expensive for large models, so the traversal result is cached. Every code path
+        that injects or deletes adapters must call `_invalidate_peft_tuner_layers()`, since an adapter can be deleted
+        and re-injected under the same name with different target modules. The adapter names are additionally
+        compared as a safeguard against `peft_config` being modified from outside.
+        """
+        adapter_names = tuple(getattr(self, "peft_config", {}))
+        if self._peft_tuner_layers is None or self._peft_tuner_layers_key != adapter_names:
+            from peft.tuners.tuners_utils import BaseTunerLayer
+
+            self._peft_tuner_layers = [module for module in self.modules() if isinstance(module, BaseTunerLayer)]
+            self._peft_tuner_layers_key = adapter_names
+        return self._peft_tuner_layers
+
+    def _invalidate_peft_tuner_layers(self) -> None:
+        self._peft_tuner_layers = None
+        self._peft_tuner_layers_key = None
+
     def set_adapter(self, adapter_name: Union[str, List[str]]) -> None:
         """
         Sets a specific adapter by forcing the model to only use that adapter and disables the other adapters.
@@ -166,30 +214,27 @@ class PeftAdapterMixin:
         if isinstance(adapter_name, str):
             adapter_name = [adapter_name]
 
-        missing = set(adapter_name) - set(self.peft_config)
+        missing = [name for name in adapter_name if name not in self.peft_config]
         if len(missing) > 0:
             raise ValueError(
                 f"Following adapter(s) could not be found: {', '.join(missing)}. Make sure you are passing the correct adapter name(s)."
                 f" current loaded adapters are: {list(self.peft_config.keys())}"
             )
 
-        from peft.tuners.tuners_utils import BaseTunerLayer
-
         _adapters_has_been_set = False
 
-        for _, module in self.named_modules():
-            if isinstance(module, BaseTunerLayer):
-                if hasattr(module, "set_adapter"):
-                    module.set_adapter(adapter_name)
-                # Previous versions of PEFT does not support multi-adapter inference
-                elif not hasattr(module, "set_adapter") and len(adapter_name) != 1:
-                    raise ValueError(
-                        "You are trying to set multiple adapters and you have a PEFT version that does not support multi-adapter inference. Please upgrade to the latest version of PEFT."
-                        " `pip install -U peft` or `pip install -U git+https://github.com/huggingface/peft.git`"
-                    )
-                else:
-                    module.active_adapter = adapter_name
-                _adapters_has_been_set = True
+        for module in self._get_peft_tuner_layers():
+            if hasattr(module, "set_adapter"):
+                module.set_adapter(adapter_name)
+            # Previous versions of PEFT does not support multi-adapter inference
+            elif not hasattr(module, "set_adapter") and len(adapter_name) != 1:
+                raise ValueError(
+                    "You are trying to set multiple adapters and you have a PEFT version that does not support multi-adapter inference. Please upgrade to the latest version of PEFT."
+                    " `pip install -U peft` or `pip install -U git+https://github.com/huggingface/peft.git`"
+                )
+            else:
+                module.active_adapter = adapter_name
+            _adapters_has_been_set = True
 
         if not _adapters_has_been_set:
             raise ValueError(
@@ -208,15 +253,12 @@ class PeftAdapterMixin:
         if not self._hf_peft_config_loaded:
             raise ValueError("No adapter loaded. Please load an adapter first.")
 
-        from peft.tuners.tuners_utils import BaseTunerLayer
-
-        for _, module in self.named_modules():
-            if isinstance(module, BaseTunerLayer):
-                if hasattr(module, "enable_adapters"):
-                    module.enable_adapters(enabled=False)
-                else:
-                    # support for older PEFT versions
-                    module.disable_adapters = True
+        for module in self._get_peft_tuner_layers():
+            if hasattr(module, "enable_adapters"):
+                module.enable_adapters(enabled=False)
+            else:
+                # support for older PEFT versions
+                module.disable_adapters = True
 
     def enable_adapters(self) -> None:
         """
@@ -231,15 +273,12 @@ class PeftAdapterMixin:
         if not self._hf_peft_config_loaded:
             raise ValueError("No adapter loaded. Please load an adapter first.")
 
-        from peft.tuners.tuners_utils import BaseTunerLayer
-
-        for _, module in self.named_modules():
-            if isinstance(module, BaseTunerLayer):
-                if hasattr(module, "enable_adapters"):
-                    module.enable_adapters(enabled=True)
-                else:
-                    # support for older PEFT versions
-                    module.disable_adapters = False
+        for module in self._get_peft_tuner_layers():
+            if hasattr(module, "enable_adapters"):
+                module.enable_adapters(enabled=True)
+            else:
+                # support for older PEFT versions
+                module.disable_adapters = False
 
     def active_adapters(self) -> List[str]:
         """
@@ -256,11 +295,9 @@ class PeftAdapterMixin:
         if not self._hf_peft_config_loaded:
             raise ValueError("No adapter loaded. Please load an adapter first.")
 
-        from peft.tuners.tuners_utils import BaseTunerLayer
-
-        for _, module in self.named_modules():
-            if isinstance(module, BaseTunerLayer):
-                return module.active_adapter
+        tuner_layers = self._get_peft_tuner_layers()
+        if len(tuner_layers) > 0:
+            return tuner_layers[0].active_adapter
 
     def fuse_lora(self, lora_scale=1.0, safe_fusing=False, adapter_names=None):
         if not USE_PEFT_BACKEND:
@@ -268,7 +305,8 @@ class PeftAdapterMixin:
 
         self.lora_scale = lora_scale
         self._safe_fusing = safe_fusing
-        self.apply(partial(self._fuse_lora_apply, adapter_names=adapter_names))
+        for module in self._get_peft_tuner_layers():
+            self._fuse_lora_apply(module, adapter_names=adapter_names)
 
     def _fuse_lora_apply(self, module, adapter_names=None):
         from peft.tuners.tuners_utils import BaseTunerLayer
@@ -279,12 +317,9 @@ class PeftAdapterMixin:
             if self.lora_scale != 1.0:
                 module.scale_layer(self.lora_scale)
 
-            # For BC with prevous PEFT versions, we need to check the signature
-            # of the `merge` method to see if it supports the `adapter_names` argument.
-            supported_merge_kwargs = list(inspect.signature(module.merge).parameters)
-            if "adapter_names" in supported_merge_kwargs:
+            if _merge_supports_adapter_names(type(module)):
                 merge_kwargs["adapter_names"] = adapter_names
-            elif "adapter_names" not in supported_merge_kwargs and adapter_names is not None:
+            elif adapter_names is not None:
                 raise ValueError(
                     "The `adapter_names` argument is not supported with your PEFT version. Please upgrade"
                     " to the latest version of PEFT. `pip install -U peft`"
@@ -295,7 +330,8 @@ class PeftAdapterMixin:
     def unfuse_lora(self):
         if not USE_PEFT_BACKEND:
             raise ValueError("PEFT backend is required for `unfuse_lora()`.")
-        self.apply(self._unfuse_lora_apply)
+        for module in self._get_peft_tuner_layers():
+            self._unfuse_lora_apply(module)
 
     def _unfuse_lora_apply(self, module):
         from peft.tuners.tuners_utils import BaseTunerLayer
@@ -307,11 +343,10 @@ class PeftAdapterMixin:
         if not USE_PEFT_BACKEND:
             raise ValueError("PEFT backend is required for `unload_lora()`.")
 
-        from ..utils import recurse_remove_peft_layers
-
         recurse_remove_peft_layers(self)
         if hasattr(self, "peft_config"):
             del self.peft_config
+        self._invalidate_peft_tuner_layers()
 
     def disable_lora(self):
         """
@@ -388,9 +423,10 @@ class PeftAdapterMixin:
         if isinstance(adapter_names, str):
             adapter_names = [adapter_names]
 
-        for adapter_name in adapter_names:
-            delete_adapter_layers(self, adapter_name)
+        delete_adapter_layers(self, adapter_names)
+        self._invalidate_peft_tuner_layers()
 
-            # Pop also the corresponding adapter from the config
-            if hasattr(self, "peft_config"):
+        # Pop also the corresponding adapters from the config
+        if hasattr(self, "peft_config"):
+            for adapter_name in adapter_names:
                 self.peft_config.pop(adapter_name, None)
@@ -43,13 +43,18 @@ from ..utils import (
     is_torch_version,
     logging,
 )
+from .lora_base import _filter_adapter_keys
 from .lora_pipeline import LORA_WEIGHT_NAME, LORA_WEIGHT_NAME_SAFE, TEXT_ENCODER_NAME, UNET_NAME
+from .peft import PeftAdapterMixin
 from .utils import AttnProcsLayers
 
 
 if is_accelerate_available():
     from accelerate.hooks import AlignDevicesHook, CpuOffload, remove_hook_from_module
 
+if USE_PEFT_BACKEND:
+    from peft import LoraConfig, inject_adapter_in_model, set_peft_model_state_dict
+
 logger = logging.get_logger(__name__)
 
 
@@ -118,6 +123,10 @@ class UNet2DConditionLoadersMixin:
             low_cpu_mem_usage (`bool`, *optional*):
                 Speed up model loading by only loading the pretrained LoRA weights and not initializing the random
                 weights.
+            auto_fuse (`bool`, *optional*, defaults to `False`):
+                Whether to fuse the LoRA weights into the base weights of the UNet right after loading them and remove
+                the LoRA layers. This removes the LoRA overhead at inference time, but the LoRA can't be unfused or
+                unloaded afterwards. Only supported when no other adapter is loaded in the UNet.
 
         Example:
 
@@ -146,6 +155,7 @@ class UNet2DConditionLoadersMixin:
         _pipeline = kwargs.pop("_pipeline", None)
         network_alphas = kwargs.pop("network_alphas", None)
         low_cpu_mem_usage = kwargs.pop("low_cpu_mem_usage", False)
+        auto_fuse = kwargs.pop("auto_fuse", False)
         allow_pickle = False
 
         if low_cpu_mem_usage and is_peft_version("<=", "0.13.0"):
@@ -219,6 +229,7 @@ class UNet2DConditionLoadersMixin:
                 adapter_name=adapter_name,
                 _pipeline=_pipeline,
                 low_cpu_mem_usage=low_cpu_mem_usage,
+                auto_fuse=auto_fuse,
             )
         else:
             raise ValueError(
@@ -279,7 +290,7 @@ class UNet2DConditionLoadersMixin:
         return attn_processors
 
     def _process_lora(
-        self, state_dict, unet_identifier_key, network_alphas, adapter_name, _pipeline, low_cpu_mem_usage
+        self, state_dict, unet_identifier_key, network_alphas, adapter_name, _pipeline, low_cpu_mem_usage, auto_fuse
     ):
         # This method does the following things:
         # 1. Filters the `state_dict` with keys matching  `unet_identifier_key` when using the non-legacy
@@ -291,19 +302,26 @@ class UNet2DConditionLoadersMixin:
         if not USE_PEFT_BACKEND:
             raise ValueError("PEFT backend is required for this method.")
 
-        from peft import LoraConfig, inject_adapter_in_model, set_peft_model_state_dict
-
-        keys = list(state_dict.keys())
+        if auto_fuse:
+            if not isinstance(self, PeftAdapterMixin):
+                raise ValueError(f"`auto_fuse=True` is not supported for {self.__class__.__name__}.")
+            if getattr(self, "peft_config", None):
+                raise ValueError(
+                    "`auto_fuse=True` is only supported when no other adapter is loaded in the Unet. Please unload the"
+                    " loaded adapters first or use `fuse_lora()` instead."
+                )
 
-        unet_keys = [k for k in keys if k.startswith(unet_identifier_key)]
         unet_state_dict = {
-            k.replace(f"{unet_identifier_key}.", ""): v for k, v in state_dict.items() if k in unet_keys
+            k.replace(f"{unet_identifier_key}.", ""): v
+            for k, v in state_dict.items()
+            if k.startswith(unet_identifier_key)
         }
 
         if network_alphas is not None:
-            alpha_keys = [k for k in network_alphas.keys() if k.startswith(unet_identifier_key)]
             network_alphas = {
-                k.replace(f"{unet_identifier_key}.", ""): v for k, v in network_alphas.items() if k in alpha_keys
+                k.replace(f"{unet_identifier_key}.", ""): v
+                for k, v in network_alphas.items()
+                if k.startswith(unet_identifier_key)
             }
 
         is_model_cpu_offload = False
@@ -323,10 +341,7 @@ class UNet2DConditionLoadersMixin:
                 # `convert_unet_state_dict_to_peft` method.
                 network_alphas = convert_unet_state_dict_to_peft(network_alphas)
 
-            rank = {}
-            for key, val in state_dict.items():
-                if "lora_B" in key:
-                    rank[key] = val.shape[1]
+            rank = {key: val.shape[1] for key, val in state_dict.items() if "lora_B" in key}
 
             lora_config_kwargs = get_peft_kwargs(rank, network_alphas, state_dict, is_unet=True)
             if "use_dora" in lora_config_kwargs:
@@ -352,14 +367,16 @@ class UNet2DConditionLoadersMixin:
                 peft_kwargs["low_cpu_mem_usage"] = low_cpu_mem_usage
 
             inject_adapter_in_model(lora_config, self, adapter_name=adapter_name, **peft_kwargs)
+            if isinstance(self, PeftAdapterMixin):
+                self._invalidate_peft_tuner_layers()
             incompatible_keys = set_peft_model_state_dict(self, state_dict, adapter_name, **peft_kwargs)
 
             warn_msg = ""
             if incompatible_keys is not None:
                 # Check only for unexpected keys.
-                unexpected_keys = getattr(incompatible_keys, "unexpected_keys", None)
+                unexpected_keys = incompatible_keys.unexpected_keys
                 if unexpected_keys:
-                    lora_unexpected_keys = [k for k in unexpected_keys if "lora_" in k and adapter_name in k]
+                    lora_unexpected_keys = _filter_adapter_keys(unexpected_keys, adapter_name)
                     if lora_unexpected_keys:
                         warn_msg = (
                             f"Loading adapter weights from state_dict led to unexpected keys found in the model:"
@@ -367,9 +384,9 @@ class UNet2DConditionLoadersMixin:
                         )
 
                 # Filter missing keys specific to the current adapter.
-                missing_keys = getattr(incompatible_keys, "missing_keys", None)
+                missing_keys = incompatible_keys.missing_keys
                 if missing_keys:
-                    lora_missing_keys = [k for k in missing_keys if "lora_" in k and adapter_name in k]
+                    lora_missing_keys = _filter_adapter_keys(missing_keys, adapter_name)
                     if lora_missing_keys:
                         warn_msg += (
                             f"Loading adapter weights from state_dict led to missing keys in the model:"
@@ -379,6 +396,10 @@ class UNet2DConditionLoadersMixin:
             if warn_msg:
                 logger.warning(warn_msg)
 
+            if auto_fuse:
+                self.fuse_lora()
+                self.unload_lora()
+
         return is_model_cpu_offload, is_sequential_cpu_offload
 
     @classmethod
@@ -399,21 +420,29 @@ class UNet2DConditionLoadersMixin:
         is_sequential_cpu_offload = False
 
         if _pipeline is not None and _pipeline.hf_device_map is None:
-            for _, component in _pipeline.components.items():
-                if isinstance(component, nn.Module) and hasattr(component, "_hf_hook"):
-                    if not is_model_cpu_offload:
-                        is_model_cpu_offload = isinstance(component._hf_hook, CpuOffload)
-                    if not is_sequential_cpu_offload:
-                        is_sequential_cpu_offload = (
-                            isinstance(component._hf_hook, AlignDevicesHook)
-                            or hasattr(component._hf_hook, "hooks")
-                            and isinstance(component._hf_hook.hooks[0], AlignDevicesHook)
-                        )
+            hooked_components = [
+                component
+                for component in _pipeline.components.values()
+                if isinstance(component, nn.Module) and hasattr(component, "_hf_hook")
+            ]
+            if len(hooked_components) > 0:
+                logger.info(
+                    "Accelerate hooks detected. Since you have called `load_lora_weights()`, the previous hooks will be first removed. Then the LoRA parameters will be loaded and the hooks will be applied again."
+                )
 
-                    logger.info(
-                        "Accelerate hooks detected. Since you have called `load_lora_weights()`, the previous hooks will be first removed. Then the LoRA parameters will be loaded and the hooks will be applied again."
+            for component in hooked_components:
+                if not is_model_cpu_offload:
+                    is_model_cpu_offload = isinstance(component._hf_hook, CpuOffload)
+                if not is_sequential_cpu_offload:
+                    is_sequential_cpu_offload = (
+                        isinstance(component._hf_hook, AlignDevicesHook)
+                        or hasattr(component._hf_hook, "hooks")
+                        and isinstance(component._hf_hook.hooks[0], AlignDevicesHook)
                     )
-                    remove_hook_from_module(component, recurse=is_sequential_cpu_offload)
+
+            # Only remove the hooks once the offloading type is known so that all components are handled the same way.
+            for component in hooked_components:
+                remove_hook_from_module(component, recurse=is_sequential_cpu_offload)
 
         return (is_model_cpu_offload, is_sequential_cpu_offload)
 
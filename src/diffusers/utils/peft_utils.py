@@ -17,7 +17,7 @@ PEFT utilities: Utilities related to peft library
 
 import collections
 import importlib
-from typing import Optional
+from typing import List, Optional, Union
 
 from packaging import version
 
@@ -213,13 +213,17 @@ def set_adapter_layers(model, enabled=True):
                 module.disable_adapters = not enabled
 
 
-def delete_adapter_layers(model, adapter_name):
+def delete_adapter_layers(model, adapter_name: Union[str, List[str]]):
     from peft.tuners.tuners_utils import BaseTunerLayer
 
+    # Several adapters can be deleted with a single walk over the model
+    adapter_names = [adapter_name] if isinstance(adapter_name, str) else adapter_name
+
     for module in model.modules():
         if isinstance(module, BaseTunerLayer):
             if hasattr(module, "delete_adapter"):
-                module.delete_adapter(adapter_name)
+                for name in adapter_names:
+                    module.delete_adapter(name)
             else:
                 raise ValueError(
                     "The version of PEFT you are using is not compatible, please use a version that is greater than 0.6.1"
@@ -227,7 +231,8 @@ def delete_adapter_layers(model, adapter_name):
 
     # For transformers integration - we need to pop the adapter from the config
     if getattr(model, "_hf_peft_config_loaded", False) and hasattr(model, "peft_config"):
-        model.peft_config.pop(adapter_name, None)
+        for name in adapter_names:
+            model.peft_config.pop(name, None)
         # In case all adapters are deleted, we need to delete the config
         # and make sure to set the flag to False
         if len(model.peft_config) == 0:
@@ -206,6 +206,33 @@ class StableDiffusionLoRATests(PeftLoraLoaderMixinTests, unittest.TestCase):
             if "lora_" in name:
                 self.assertNotEqual(param.device, torch.device("cpu"))
 
+    @require_peft_backend
+    def test_lora_auto_fuse(self):
+        from peft.utils import get_peft_model_state_dict
+
+        components, _, denoiser_lora_config = self.get_dummy_components(self.scheduler_cls)
+        pipe = self.pipeline_class(**components)
+        pipe = pipe.to(torch_device)
+        pipe.set_progress_bar_config(disable=None)
+        _, _, inputs = self.get_dummy_inputs(with_generator=False)
+
+        pipe.unet.add_adapter(denoiser_lora_config)
+        self.assertTrue(check_if_lora_correctly_set(pipe.unet), "Lora not correctly set in Unet")
+
+        images_lora = pipe(**inputs, generator=torch.manual_seed(0)).images
+        unet_state_dict = get_peft_model_state_dict(pipe.unet)
+        pipe.unload_lora_weights()
+
+        state_dict = {f"unet.{k}": v for k, v in unet_state_dict.items()}
+        pipe.load_lora_into_unet(state_dict, network_alphas=None, unet=pipe.unet, auto_fuse=True)
+        self.assertFalse(check_if_lora_correctly_set(pipe.unet), "LoRA layers should be removed after auto-fusing.")
+
+        images_auto_fused = pipe(**inputs, generator=torch.manual_seed(0)).images
+        self.assertTrue(
+            np.allclose(images_lora, images_auto_fused, atol=1e-3, rtol=1e-3),
+            "Auto-fusing the LoRA should give the same results as the unfused LoRA.",
+        )
+
 
 @slow
 @nightly
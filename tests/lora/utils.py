@@ -1834,6 +1834,43 @@ class PeftLoraLoaderMixinTests:
 
         self.assertTrue(".diffusers_cat" in cap_logger.out)
 
+    def test_reload_deleted_adapter_with_more_target_modules(self):
+        scheduler_cls = self.scheduler_classes[0]
+        components, _, denoiser_lora_config = self.get_dummy_components(scheduler_cls)
+        pipe = self.pipeline_class(**components)
+        pipe = pipe.to(torch_device)
+        pipe.set_progress_bar_config(disable=None)
+
+        denoiser = pipe.transformer if self.unet_kwargs is None else pipe.unet
+        denoiser.add_adapter(denoiser_lora_config)
+        self.assertTrue(check_if_lora_correctly_set(denoiser), "Lora not correctly set in denoiser.")
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            modules_to_save = self._get_modules_to_save(pipe, has_denoiser=True)
+            lora_state_dicts = self._get_lora_state_dicts(modules_to_save)
+            self.pipeline_class.save_lora_weights(
+                save_directory=tmpdirname, safe_serialization=False, **lora_state_dicts
+            )
+            pipe.unload_lora_weights()
+            state_dict = torch.load(os.path.join(tmpdirname, "pytorch_lora_weights.bin"), weights_only=True)
+
+        # Load a LoRA that only targets the query projections and have the denoiser collect its LoRA layers.
+        pipe.load_lora_weights({k: v for k, v in state_dict.items() if "to_q" in k}, adapter_name="adapter-1")
+        denoiser.set_adapter("adapter-1")
+        pipe.delete_adapters("adapter-1")
+
+        # Reusing the adapter name with more target modules must not reuse the previously collected LoRA layers.
+        pipe.load_lora_weights(state_dict, adapter_name="adapter-1")
+        denoiser.fuse_lora(adapter_names=["adapter-1"])
+
+        lora_layers = {
+            name: module
+            for name, module in denoiser.named_modules()
+            if isinstance(module, BaseTunerLayer) and "adapter-1" in module.lora_A
+        }
+        self.assertTrue(any("to_k" in name for name in lora_layers), "Lora not correctly set in denoiser.")
+        self.assertTrue(all(module.merged for module in lora_layers.values()), "All LoRA layers should be fused.")
+
     @unittest.skip("This is failing for now - need to investigate")
     def test_simple_inference_with_text_denoiser_lora_unfused_torch_compile(self):
         """
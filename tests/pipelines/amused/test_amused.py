@@ -20,8 +20,10 @@ import torch
 from transformers import CLIPTextConfig, CLIPTextModelWithProjection, CLIPTokenizer
 
 from diffusers import AmusedPipeline, AmusedScheduler, UVit2DModel, VQModel
+from diffusers.loaders import AmusedLoraLoaderMixin
 from diffusers.utils.testing_utils import (
     enable_full_determinism,
+    require_peft_backend,
     require_torch_gpu,
     slow,
     torch_device,
@@ -127,6 +129,34 @@ class AmusedPipelineFastTests(PipelineTesterMixin, unittest.TestCase):
     def test_inference_batch_single_identical(self):
         ...
 
+    @require_peft_backend
+    def test_lora_auto_fuse(self):
+        from peft import LoraConfig
+        from peft.utils import get_peft_model_state_dict
+
+        lora_config = LoraConfig(
+            r=4, lora_alpha=4, target_modules=["to_q", "to_k", "to_v", "to_out.0"], init_lora_weights=False
+        )
+
+        transformer = self.get_dummy_components()["transformer"]
+        transformer.add_adapter(lora_config)
+        transformer_state_dict = get_peft_model_state_dict(transformer)
+        transformer.fuse_lora()
+        transformer.unload_lora()
+        expected_state_dict = transformer.state_dict()
+
+        transformer = self.get_dummy_components()["transformer"]
+        state_dict = {f"transformer.{k}": v for k, v in transformer_state_dict.items()}
+        AmusedLoraLoaderMixin.load_lora_into_transformer(
+            state_dict, network_alphas=None, transformer=transformer, auto_fuse=True
+        )
+
+        self.assertFalse(getattr(transformer, "peft_config", None), "LoRA config should be removed after auto-fusing.")
+        auto_fused_state_dict = transformer.state_dict()
+        self.assertEqual(expected_state_dict.keys(), auto_fused_state_dict.keys())
+        for key, value in expected_state_dict.items():
+            self.assertTrue(torch.allclose(value, auto_fused_state_dict[key], atol=1e-6), f"Mismatch in {key}.")
+
 
 @slow
 @require_torch_gpu